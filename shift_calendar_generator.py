@@ -2,55 +2,117 @@
 creates calendar events for shift work
 """
 
+import bisect
 import logging
+import os
 import sys
-from dataclasses import dataclass
-from datetime import datetime
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from operator import attrgetter
 from pathlib import Path
 from uuid import UUID, uuid4
 
 from PyQt6.QtCore import QTime
+from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import (QApplication, QCalendarWidget, QFileDialog,
                              QGridLayout, QHBoxLayout, QLabel, QMainWindow,
                              QPushButton, QStyle, QTimeEdit, QVBoxLayout,
                              QWidget)
 
-log = logging.getLogger(Path(__file__).name)
-logging.basicConfig(level=logging.INFO)
+_MODULE_NAME = Path(__file__).name
+log = logging.getLogger(_MODULE_NAME)
 
+# sort key for putting events in start time order
+_start_key = attrgetter('dtstart')
 
-@dataclass
+# shared dtstamp for events created inside Event.stamp_batch, kept per
+# thread and per async task so concurrent batches cannot overwrite it
+_batch_stamp: ContextVar[datetime] = ContextVar('batch_stamp', default=None)
+
+
+def _fmt(dt: datetime) -> str:
+    """formats a datetime as an iCalendar local time without strftime"""
+    return (
+        f'{dt.year:04}{dt.month:02}{dt.day:02}'
+        f'T{dt.hour:02}{dt.minute:02}{dt.second:02}'
+    )
+
+
+def _shift_span(
+    shift_date: date, start_time: time, end_time: time,
+) -> tuple[datetime, datetime]:
+    """
+    returns the start and end of a shift starting on the given date
+
+    shifts ending at or before their start time finish the next day
+    """
+    end_date = shift_date
+    if end_time <= start_time:
+        end_date += timedelta(days=1)
+    return (
+        datetime.combine(shift_date, start_time),
+        datetime.combine(end_date, end_time),
+    )
+
+
+@dataclass(slots=True, eq=False, frozen=True)
 class Event:
-    """container for an event"""
+    """
+    container for an event
+
+    events are frozen so their cached iCalendar string cannot go stale.
+    they compare and hash by identity, use _start_key to order them
+    """
     organiser: str
     dtstart: datetime
     dtend: datetime
     summary: str
     dtstamp: datetime = None
     uid: UUID = None
-
-    DT_FORMAT = '%Y%m%dT%H%M%S'
+    _cached_str: str = field(
+        default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
         if self.uid is None:
-            self.uid = uuid4()
+            object.__setattr__(self, 'uid', uuid4())
         if self.dtstamp is None:
-            self.dtstamp = datetime.now()
+            object.__setattr__(
+                self, 'dtstamp', _batch_stamp.get() or datetime.now())
+
+    @classmethod
+    @contextmanager
+    def stamp_batch(cls) -> Iterator[datetime]:
+        """gives every event created in this context the same dtstamp"""
+        stamp = datetime.now()
+        token = _batch_stamp.set(stamp)
+        try:
+            yield stamp
+        finally:
+            _batch_stamp.reset(token)
 
     def to_str(self) -> str:
         """
         converts this object to the event portion of an iCalendar file string
-        """
-        content = ['BEGIN:VEVENT']
-        content.append(f'UID:{self.uid}')
-        content.append(f'ORGANIZER:{self.organiser}')
-        content.append(f'DTSTAMP:{self.dtstamp.strftime(self.DT_FORMAT)}')
-        content.append(f'DTSTART:{self.dtstart.strftime(self.DT_FORMAT)}')
-        content.append(f'DTEND:{self.dtend.strftime(self.DT_FORMAT)}')
-        content.append(f'SUMMARY:{self.summary}')
-        content.append('END:VEVENT')
 
-        return '\n'.join(content)
+        the result is cached, which is safe as events are frozen
+        """
+        if self._cached_str is not None:
+            return self._cached_str
+
+        object.__setattr__(self, '_cached_str', (
+            'BEGIN:VEVENT\r\n'
+            f'UID:{self.uid}\r\n'
+            f'ORGANIZER:{self.organiser}\r\n'
+            f'DTSTAMP:{_fmt(self.dtstamp)}\r\n'
+            f'DTSTART:{_fmt(self.dtstart)}\r\n'
+            f'DTEND:{_fmt(self.dtend)}\r\n'
+            f'SUMMARY:{self.summary}\r\n'
+            'END:VEVENT'
+        ))
+        return self._cached_str
 
     def gui_str(self) -> str:
         """formats the start date as a nice str for the gui"""
@@ -60,46 +122,109 @@ class Event:
             f'{self.dtend.strftime('%I:%M %p')}'
         )
 
-    def __lt__(self, other: 'Event') -> bool:
-        return self.dtstart < other.dtstart
-
-    def __eq__(self, other: 'Event') -> bool:
-        return self.dtstart == other.dtstart
-
 
-@dataclass
+@dataclass(slots=True)
 class Calendar:
-    """basis for creating an iCalendar event file"""
+    """
+    basis for creating an iCalendar event file
+
+    events are kept in start time order so they can be written out as is
+    """
     prodid: str
     version: str = '2.0'
     events: list[Event] = None
+    _header: str = field(init=False, repr=False, compare=False)
+    _footer: str = field(init=False, repr=False, compare=False)
+
+    # O_BINARY stops windows translating the CRLF line endings
+    OPEN_FLAGS = (
+        os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0))
 
     def __post_init__(self):
         if self.events is None:
             self.events = list()
+        else:
+            self.events = sorted(self.events, key=_start_key)
+        # only the events change between saves
+        self._header = (
+            'BEGIN:VCALENDAR\r\n'
+            f'VERSION:{self.version}\r\n'
+            f'PRODID:{self.prodid}\r\n'
+        )
+        self._footer = 'END:VCALENDAR\r\n'
+
+    def add(self, event: Event) -> int:
+        """inserts an event in start time order and returns its index"""
+        index = bisect.bisect_right(
+            self.events, event.dtstart, key=_start_key)
+        self.events.insert(index, event)
+        return index
+
+    def add_recurring(
+        self, organiser: str, summary: str, start_date: date, days: int,
+        start_time: time, end_time: time,
+    ) -> list[Event]:
+        """
+        adds the same shift on each of the given number of days
+
+        shifts ending at or before their start time end the next day
+        """
+        if days < 0:
+            raise ValueError(f'days must not be negative, got {days}')
+        events = []
+        with Event.stamp_batch():
+            for day in range(days):
+                dtstart, dtend = _shift_span(
+                    start_date + timedelta(days=day), start_time, end_time)
+                events.append(Event(
+                    organiser=organiser,
+                    dtstart=dtstart,
+                    dtend=dtend,
+                    summary=summary,
+                ))
+        # the new events are already in order so this sort is a cheap merge
+        self.events.extend(events)
+        self.events.sort(key=_start_key)
+        return events
+
+    def remove(self, event: Event) -> None:
+        """removes an event, finding it by start time rather than scanning"""
+        start = bisect.bisect_left(
+            self.events, event.dtstart, key=_start_key)
+        end = bisect.bisect_right(
+            self.events, event.dtstart, lo=start, key=_start_key)
+        # step over any other events that start at the same time
+        for index in range(start, end):
+            if self.events[index] is event:
+                del self.events[index]
+                return
+        raise ValueError(f'event not in calendar: {event.uid}')
 
     def to_str(self) -> str:
         """converts this object to an iCalendar file string"""
-        content = ['BEGIN:VCALENDAR']
-        content.append(f'VERSION:{self.version}')
-        content.append(f'PRODID:{self.prodid}')
-        for event in sorted(self.events):
-            content.append(event.to_str())
-        content.append('END:VCALENDAR')
-
-        return '\n'.join(content)
+        events = ''.join(f'{event.to_str()}\r\n' for event in self.events)
+        return f'{self._header}{events}{self._footer}'
 
     def to_file(self, filename: Path) -> None:
         """saves this object to an iCalendar file"""
         save_to = filename.with_suffix('.ics')
-        with open(save_to, 'w') as file:
-            file.write(self.to_str())
+        # encode the whole file once and hand it to the os in as few writes
+        # as possible, skipping the text file layer
+        payload = self.to_str().encode()
+
+        fd = os.open(save_to, self.OPEN_FLAGS, 0o644)
+        try:
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
         log.info(f'saved to "{save_to}"')
 
 
 class EventLayout(QHBoxLayout):
     """stores a label for showing the event time and a delete button"""
-    def __init__(self, event: Event, delete_func: callable):
+    def __init__(self, event: Event, delete_func: callable, bin_icon: QIcon):
         super().__init__()
         self.event = event
         self.delete_func = delete_func
@@ -107,8 +232,6 @@ class EventLayout(QHBoxLayout):
         label = QLabel()
         label.setText(event.gui_str())
         delete_button = QPushButton()
-        bin_pxmap = QStyle.StandardPixmap.SP_DialogCancelButton
-        bin_icon = delete_button.style().standardIcon(bin_pxmap)
         delete_button.setIcon(bin_icon)
         delete_button.setFixedWidth(50)
         delete_button.clicked.connect(self.delete_this_event)
@@ -121,10 +244,10 @@ class EventLayout(QHBoxLayout):
         """deletes the label and button widgets for removal"""
         for widget in self.widgets:
             self.removeWidget(widget)
+            widget.deleteLater()
 
     def delete_this_event(self) -> None:
         """deletes this event from the list of shifts"""
-        self.remove()
         self.delete_func()
         log.info(f'deleted event: {self.event.gui_str()}')
 
@@ -132,12 +255,16 @@ class EventLayout(QHBoxLayout):
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.setWindowTitle(Path(__file__).name)
+        self.setWindowTitle(_MODULE_NAME)
 
         layout = QHBoxLayout()
         controls = QVBoxLayout()
         self.shifts = QVBoxLayout()
-        self.shift_events = []
+        # event layouts by event uid, in the order they were added
+        self.shift_events: dict[UUID, EventLayout] = {}
+        # looked up once and shared by every event's delete button
+        bin_pxmap = QStyle.StandardPixmap.SP_DialogCancelButton
+        self.bin_icon = self.style().standardIcon(bin_pxmap)
 
         add_button = QPushButton('Add event')
         add_button.clicked.connect(self.add_event)
@@ -190,52 +317,54 @@ class MainWindow(QMainWindow):
         widget.setLayout(layout)
         self.setCentralWidget(widget)
 
-        self.calendar = Calendar(Path(__file__).name)
+        self.calendar = Calendar(_MODULE_NAME)
 
     def add_event(self) -> None:
         """adds an event with the current time settings"""
         start_time = self.start_time_input.time()
         end_time = self.end_time_input.time()
-        date = self.date_input.selectedDate()
+        selected = self.date_input.selectedDate()
 
-        start_datetime = datetime(
-            year=date.year(), month=date.month(), day=date.day(),
-            hour=start_time.hour(), minute=start_time.minute(),
-        )
-        end_datetime = datetime(
-            year=date.year(), month=date.month(), day=date.day(),
-            hour=end_time.hour(), minute=end_time.minute(),
+        start_datetime, end_datetime = _shift_span(
+            date(selected.year(), selected.month(), selected.day()),
+            time(start_time.hour(), start_time.minute()),
+            time(end_time.hour(), end_time.minute()),
         )
 
         event = Event(
-            organiser=Path(__file__).name,
+            organiser=_MODULE_NAME,
             dtstart=start_datetime,
             dtend=end_datetime,
             summary='long day'
         )
-        self.calendar.events.append(event)
-        self.shift_events.append(
-            EventLayout(event, self.get_delete_func(event)))
-        self.update_shifts()
+        index = self.calendar.add(event)
+        event_layout = EventLayout(
+            event, self.get_delete_func(event), self.bin_icon)
+        # offset by 1 as the first widget is the title
+        self.shifts.insertLayout(index + 1, event_layout)
+        self.shift_events[event.uid] = event_layout
         log.info(f'added event: {event.gui_str()}')
 
     def delete_last_event(self) -> None:
         """deletes the most recently added event from the calendar"""
-        if len(self.calendar.events) > 0:
-            event = self.calendar.events.pop()
-            for event_layout in self.shift_events:
-                if event_layout.event == event:
-                    break
-            self.update_shifts()
+        if len(self.shift_events) > 0:
+            event = next(reversed(self.shift_events.values())).event
+            self.remove_event(event)
             log.info(f'deleted last event: {event.gui_str()}')
 
     def get_delete_func(self, event: Event) -> callable:
         """returns a func that an EventLayout can use to delete itself"""
         def delete_func() -> None:
-            self.calendar.events.remove(event)
-            self.update_shifts()
+            self.remove_event(event)
         return delete_func
 
+    def remove_event(self, event: Event) -> None:
+        """removes an event from the calendar and its layout from the shifts"""
+        self.calendar.remove(event)
+        event_layout = self.shift_events.pop(event.uid)
+        event_layout.remove()
+        self.shifts.removeItem(event_layout)
+
     def save_to_file(self) -> None:
         """opens a file dialog and saves the file to the specified filename"""
         from_dialog = self.save_dialog.getSaveFileName()[0]
@@ -244,22 +373,13 @@ class MainWindow(QMainWindow):
         else:
             log.warning('Save dialog closed. File not saved!')
 
-    def update_shifts(self) -> None:
-        """removes and re-adds the shift events"""
-        for event_layout in self.shift_events:
-            event_layout.remove()
-            self.shifts.removeItem(event_layout)
-        self.shift_events = []
-        for event in sorted(self.calendar.events):
-            event_layout = EventLayout(event, self.get_delete_func(event))
-            # insert widgets 1 before last as it is a padding widget
-            self.shifts.insertLayout(self.shifts.count() - 1, event_layout)
-            self.shift_events.append(event_layout)
 
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
 
-app = QApplication(sys.argv)
+    app = QApplication(sys.argv)
 
-window = MainWindow()
-window.show()
+    window = MainWindow()
+    window.show()
 
-app.exec()
+    app.exec()
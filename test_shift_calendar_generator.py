@@ -0,0 +1,175 @@
+"""
+tests for the calendar side of shift_calendar_generator
+"""
+
+import dataclasses
+import threading
+from datetime import date, datetime, time
+
+import pytest
+
+from shift_calendar_generator import Calendar, Event, _fmt, _shift_span
+
+HOURS = [0, 11, 12, 23]
+
+
+def make_event(start: datetime, end: datetime = None) -> Event:
+    return Event(
+        organiser='test',
+        dtstart=start,
+        dtend=start if end is None else end,
+        summary='shift',
+    )
+
+
+@pytest.mark.parametrize('hour', HOURS)
+def test_fmt_matches_strftime(hour):
+    dt = datetime(2024, 3, 7, hour, 5, 9)
+    assert _fmt(dt) == dt.strftime('%Y%m%dT%H%M%S')
+
+
+def test_to_str_is_cached():
+    event = make_event(datetime(2024, 1, 1, 7))
+    assert event.to_str() is event.to_str()
+    assert 'DTSTART:20240101T070000\r\n' in event.to_str()
+
+
+def test_event_cannot_be_mutated_after_caching():
+    event = make_event(datetime(2024, 1, 1, 7))
+    saved = event.to_str()
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        event.summary = 'changed'
+    assert event.to_str() == saved
+
+
+def test_stamp_batch_shares_one_dtstamp():
+    with Event.stamp_batch() as stamp:
+        events = [make_event(datetime(2024, 1, 1)) for _ in range(3)]
+    assert all(event.dtstamp is stamp for event in events)
+    assert make_event(datetime(2024, 1, 1)).dtstamp is not stamp
+
+
+def test_stamp_batch_restores_after_nested_and_sequential_batches():
+    with Event.stamp_batch() as outer:
+        with Event.stamp_batch() as inner:
+            assert make_event(datetime(2024, 1, 1)).dtstamp is inner
+        assert make_event(datetime(2024, 1, 1)).dtstamp is outer
+    with Event.stamp_batch() as second:
+        assert make_event(datetime(2024, 1, 1)).dtstamp is second
+    for stamp in (outer, inner, second):
+        assert make_event(datetime(2024, 1, 1)).dtstamp is not stamp
+
+
+def test_stamp_batch_is_per_thread():
+    # A enters, B enters, A exits, B exits
+    b_entered = threading.Event()
+    a_exited = threading.Event()
+    stamps = {}
+
+    def thread_a():
+        with Event.stamp_batch() as stamps['a']:
+            b_entered.wait()
+        a_exited.set()
+
+    def thread_b():
+        with Event.stamp_batch() as stamps['b']:
+            b_entered.set()
+            a_exited.wait()
+            stamps['b_event'] = make_event(datetime(2024, 1, 1)).dtstamp
+
+    threads = [threading.Thread(target=thread_a),
+               threading.Thread(target=thread_b)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stamps['b_event'] is stamps['b']
+    after = make_event(datetime(2024, 1, 1)).dtstamp
+    assert after is not stamps['a'] and after is not stamps['b']
+
+
+def test_to_file_uses_crlf(tmp_path):
+    calendar = Calendar('test')
+    calendar.add(make_event(datetime(2024, 1, 2, 7)))
+    calendar.add(make_event(datetime(2024, 1, 1, 7)))
+    calendar.to_file(tmp_path / 'shifts')
+
+    data = (tmp_path / 'shifts.ics').read_bytes()
+    assert data == calendar.to_str().encode()
+    assert data.endswith(b'END:VCALENDAR\r\n')
+    assert data.count(b'\n') == data.count(b'\r\n')
+    assert b'\r\r' not in data
+
+
+def test_add_keeps_ties_in_insertion_order():
+    calendar = Calendar('test')
+    start = datetime(2024, 1, 1, 7)
+    first = make_event(start)
+    second = make_event(start)
+    earlier = make_event(datetime(2024, 1, 1, 6))
+
+    assert calendar.add(first) == 0
+    assert calendar.add(second) == 1
+    assert calendar.add(earlier) == 0
+    assert calendar.events == [earlier, first, second]
+
+
+def test_remove_picks_the_exact_event_among_ties():
+    start = datetime(2024, 1, 1, 7)
+    events = [make_event(start) for _ in range(3)]
+    calendar = Calendar('test', events=list(events))
+
+    calendar.remove(events[1])
+    assert calendar.events == [events[0], events[2]]
+
+
+def test_remove_missing_event_raises_value_error():
+    start = datetime(2024, 1, 1, 7)
+    calendar = Calendar('test', events=[make_event(start)])
+
+    with pytest.raises(ValueError):
+        calendar.remove(make_event(start))
+    with pytest.raises(ValueError):
+        calendar.remove(make_event(datetime(2025, 1, 1)))
+
+
+def test_add_recurring_day_shift():
+    calendar = Calendar('test')
+    events = calendar.add_recurring(
+        'test', 'day', date(2024, 1, 1), 3, time(7), time(19))
+
+    assert [e.dtstart for e in events] == [
+        datetime(2024, 1, day, 7) for day in (1, 2, 3)]
+    assert [e.dtend for e in events] == [
+        datetime(2024, 1, day, 19) for day in (1, 2, 3)]
+    assert len({e.dtstamp for e in events}) == 1
+    assert calendar.events == events
+
+
+def test_add_recurring_overnight_shift_ends_next_day():
+    calendar = Calendar('test')
+    events = calendar.add_recurring(
+        'test', 'night', date(2024, 1, 31), 2, time(19), time(7))
+
+    assert [(e.dtstart, e.dtend) for e in events] == [
+        (datetime(2024, 1, 31, 19), datetime(2024, 2, 1, 7)),
+        (datetime(2024, 2, 1, 19), datetime(2024, 2, 2, 7)),
+    ]
+
+
+@pytest.mark.parametrize('start, end, end_day', [
+    (time(7), time(19), 1),
+    (time(19), time(7), 2),
+    (time(7), time(7), 2),
+])
+def test_shift_span_moves_overnight_end_to_next_day(start, end, end_day):
+    dtstart, dtend = _shift_span(date(2024, 1, 1), start, end)
+    assert dtstart == datetime.combine(date(2024, 1, 1), start)
+    assert dtend == datetime.combine(date(2024, 1, end_day), end)
+
+
+def test_add_recurring_rejects_negative_days():
+    with pytest.raises(ValueError):
+        Calendar('test').add_recurring(
+            'test', 'day', date(2024, 1, 1), -1, time(7), time(19))